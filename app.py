@@ -1,15 +1,59 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import and_, bindparam, event, func, inspect, literal, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from datetime import datetime, timedelta
+import click
+import functools
+import hashlib
+import heapq
+import itertools
+import json
 import os
-from pdf_generator import generate_pdf
+from compression import choose_encoding, compress_response
+from pdf_generator import generate_consolidated_pdf, generate_pdf
+from rate_limiter import RateLimiter
+from report_scheduler import PERIOD_RULES, in_offpeak_window, next_run_at, report_period, start_scheduler_thread
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///transport.db'
+# Cold storage for old entries moved out by `flask archive-entries`
+app.config['SQLALCHEMY_BINDS'] = {'archive': 'sqlite:///transport_archive.db'}
+app.config['ARCHIVE_AFTER_DAYS'] = 730
+app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = 24
+app.config['CHANGE_LOG_RETENTION_DAYS'] = 90
+# Scheduled reports render between these local hours [start, end)
+app.config['REPORT_OFFPEAK_HOURS'] = (1, 5)
+app.config['REPORT_SCHEDULER_ENABLED'] = False
+app.config['REPORT_SCHEDULER_INTERVAL_SECONDS'] = 300
+# Per-client limits for expensive endpoints: rate is requests per second,
+# concurrency caps are per client and across all clients
+app.config['RATE_LIMITS'] = {
+    'reports': {'rate': 0.2, 'burst': 3, 'per_client_concurrency': 1, 'concurrency': 2},
+    'listings': {'rate': 5, 'burst': 20, 'per_client_concurrency': 4, 'concurrency': 8},
+}
+# Set to a file path to share rate limit buckets between worker processes
+app.config['RATE_LIMIT_STORAGE'] = None
+# Responses smaller than this are not worth compressing
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_MIMETYPES'] = {
+    'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript'
+}
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 
 db = SQLAlchemy(app)
+limiter = RateLimiter(app)
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 # Database Models
 class Vehicle(db.Model):
@@ -17,23 +61,644 @@ class Vehicle(db.Model):
     name = db.Column(db.String(100), nullable=False)
     default_rate = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    entries = db.relationship('TransportEntry', backref='vehicle', lazy=True, cascade='all, delete-orphan')
+    archived_at = db.Column(db.DateTime, nullable=True)
+    entries = db.relationship('TransportEntry', backref='vehicle', lazy=True,
+                              cascade='all, delete-orphan', passive_deletes=True)
+
+class Route(db.Model):
+    """Route master; entries reference it instead of repeating the name"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False, unique=True)
+    # Used to fill in entries that leave km or rate out
+    default_km = db.Column(db.Float, nullable=True)
+    default_rate = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class TransportEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=False)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
+    km_driven = db.Column(db.Float, nullable=False)
+    rate = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    extra = db.Column(db.Float, default=0.0)
+    total_amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every update; writers compare it to detect lost updates
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Joined so listings get route names in the same query
+    route = db.relationship('Route', lazy='joined')
+
+    # AUTOINCREMENT so ids of archived entries are never handed out again
+    __table_args__ = (
+        db.Index('ix_transport_entry_vehicle_date', 'vehicle_id', 'date'),
+        db.Index('ix_transport_entry_date', 'date'),
+        db.Index('ix_transport_entry_route_date', 'route_id', 'date'),
+        {'sqlite_autoincrement': True},
+    )
+
+    @property
+    def route_name(self):
+        return self.route.name
+
+class ArchivedEntry(db.Model):
+    """Entry moved out of transport_entry; ids are kept from the live table.
+    
+    Entries are grouped by route_id like live ones; the route name as it
+    was when archived is kept as text so the archive stands on its own.
+    """
+    __bind_key__ = 'archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    vehicle_id = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date, nullable=False)
+    route_id = db.Column(db.Integer, nullable=True)
     route_name = db.Column(db.String(200), nullable=False)
     km_driven = db.Column(db.Float, nullable=False)
     rate = db.Column(db.Float, nullable=False)
     amount = db.Column(db.Float, nullable=False)
     extra = db.Column(db.Float, default=0.0)
     total_amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_archived_entry_vehicle_date', 'vehicle_id', 'date'),
+        db.Index('ix_archived_entry_date', 'date'),
+        db.Index('ix_archived_entry_route_date', 'route_id', 'date'),
+    )
+
+class IdempotencyKey(db.Model):
+    """Stored result of a write made with an Idempotency-Key header"""
+    key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ChangeLog(db.Model):
+    """One row per write, read by clients syncing through /api/changes"""
+    # AUTOINCREMENT keeps seq monotonic even after old rows are pruned
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    vehicle_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ReportSchedule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id', ondelete='CASCADE'), nullable=False)
+    period_rule = db.Column(db.String(20), nullable=False)
+    from_address = db.Column(db.Text, default='')
+    to_address = db.Column(db.Text, default='')
+    active = db.Column(db.Boolean, default=True)
+    # Local time, always at the start of the off-peak window
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class RenderedReport(db.Model):
+    """A PDF rendered ahead of time by the report scheduler"""
+    id = db.Column(db.Integer, primary_key=True)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('report_schedule.id', ondelete='SET NULL'), nullable=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id', ondelete='CASCADE'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    from_address = db.Column(db.Text, default='')
+    to_address = db.Column(db.Text, default='')
+    path = db.Column(db.String(300), nullable=False)
+    # Change feed head when rendered; any later change to the vehicle makes it stale
+    change_seq = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_rendered_report_vehicle_period', 'vehicle_id', 'start_date', 'end_date'),
+    )
+
+# Columns copied verbatim when an entry is archived
+ARCHIVE_COLUMNS = ('id', 'vehicle_id', 'date', 'route_id', 'route_name', 'km_driven', 'rate',
+                   'amount', 'extra', 'total_amount', 'created_at')
+
+# SQLite expressions that bucket a date column for analytics; weeks are
+# labelled by their Monday so a week spanning New Year stays one bucket
+BUCKET_PERIODS = {
+    'day': lambda column: func.strftime('%Y-%m-%d', column),
+    'week': lambda column: func.date(column, 'weekday 0', '-6 days'),
+    'month': lambda column: func.strftime('%Y-%m', column),
+}
+
+def intern_route_names(engine):
+    """Replace transport_entry.route_name text with route_id references.
+    
+    Names are trimmed the same way get_or_create_route trims new ones.
+    """
+    columns = {c['name'] for c in inspect(engine).get_columns('transport_entry')}
+    if 'route_name' not in columns or 'route_id' in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            'INSERT OR IGNORE INTO route (name, created_at) '
+            'SELECT DISTINCT TRIM(route_name), CURRENT_TIMESTAMP FROM transport_entry'
+        ))
+        conn.execute(text('ALTER TABLE transport_entry ADD COLUMN route_id INTEGER REFERENCES route (id)'))
+        conn.execute(text(
+            'UPDATE transport_entry SET route_id = '
+            '(SELECT id FROM route WHERE route.name = TRIM(transport_entry.route_name))'
+        ))
+        # Needs SQLite 3.35+
+        conn.execute(text('ALTER TABLE transport_entry DROP COLUMN route_name'))
+
+def stop_entry_id_reuse(engine, archive_engine):
+    """Keep transport_entry ids ahead of every id already in the archive"""
+    with archive_engine.connect() as conn:
+        archived_max = conn.execute(text('SELECT MAX(id) FROM archived_entry')).scalar() or 0
+    with engine.begin() as conn:
+        ddl = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'transport_entry'"
+        )).scalar()
+        if 'AUTOINCREMENT' not in ddl.upper():
+            # SQLite cannot add AUTOINCREMENT to a table, so rebuild it
+            for index in inspect(conn).get_indexes('transport_entry'):
+                conn.execute(text(f'DROP INDEX {index["name"]}'))
+            conn.execute(text('ALTER TABLE transport_entry RENAME TO transport_entry_old'))
+            TransportEntry.__table__.create(conn)
+            columns = ', '.join(column.name for column in TransportEntry.__table__.columns)
+            conn.execute(text(f'INSERT INTO transport_entry ({columns}) SELECT {columns} FROM transport_entry_old'))
+            conn.execute(text('DROP TABLE transport_entry_old'))
+            
+            # Entries that already got the id of an archived entry move to fresh ids
+            live_ids = conn.execute(text(
+                'SELECT id FROM transport_entry WHERE id <= :max_id ORDER BY id'
+            ), {'max_id': archived_max}).scalars().all()
+            reused = []
+            with archive_engine.connect() as archive_conn:
+                for start in range(0, len(live_ids), 500):
+                    reused += archive_conn.execute(
+                        ArchivedEntry.__table__.select().with_only_columns(ArchivedEntry.id)
+                        .where(ArchivedEntry.id.in_(live_ids[start:start + 500]))
+                    ).scalars().all()
+            next_id = max(archived_max, conn.execute(text('SELECT MAX(id) FROM transport_entry')).scalar() or 0)
+            for old_id in sorted(reused):
+                next_id += 1
+                conn.execute(text('UPDATE transport_entry SET id = :new_id WHERE id = :old_id'),
+                             {'new_id': next_id, 'old_id': old_id})
+                # Synced clients drop the old id and pick up the new one
+                for entity_id, op in ((old_id, 'delete'), (next_id, 'upsert')):
+                    conn.execute(text(
+                        'INSERT INTO change_log (entity, entity_id, vehicle_id, op, created_at) '
+                        "SELECT 'entry', :entity_id, vehicle_id, :op, CURRENT_TIMESTAMP "
+                        'FROM transport_entry WHERE id = :new_id'
+                    ), {'entity_id': entity_id, 'op': op, 'new_id': next_id})
+        
+        # Renumbering by UPDATE does not advance the sequence, so cover live ids too
+        highest = max(archived_max, conn.execute(text('SELECT MAX(id) FROM transport_entry')).scalar() or 0)
+        sequence = conn.execute(text(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'transport_entry'"
+        )).scalar()
+        if sequence is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('transport_entry', :seq)"),
+                         {'seq': highest})
+        elif sequence < highest:
+            conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'transport_entry'"),
+                         {'seq': highest})
+
+def backfill_archived_route_ids(engine, archive_engine):
+    """Fill route_id on entries archived before the archive recorded it"""
+    with archive_engine.begin() as archive_conn:
+        names = archive_conn.execute(text(
+            'SELECT DISTINCT route_name FROM archived_entry WHERE route_id IS NULL'
+        )).scalars().all()
+        if not names:
+            return
+        with engine.begin() as conn:
+            # Names of since-renamed routes get a route of their own
+            for name in names:
+                conn.execute(text('INSERT OR IGNORE INTO route (name, created_at) VALUES (:name, CURRENT_TIMESTAMP)'),
+                             {'name': name})
+            route_ids = dict(conn.execute(text('SELECT name, id FROM route')).all())
+        for name in names:
+            archive_conn.execute(text(
+                'UPDATE archived_entry SET route_id = :route_id WHERE route_name = :name AND route_id IS NULL'
+            ), {'route_id': route_ids[name], 'name': name})
+
+def _upgrade_table(engine, table):
+    existing = {c['name'] for c in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+def upgrade_schema():
+    """Create missing tables, columns and indexes on an existing database"""
+    db.create_all(bind_key='__all__')
+    intern_route_names(db.engine)
+    # Each bind has its own metadata, so walk them all
+    for bind_key, metadata in db.metadatas.items():
+        engine = db.engines[bind_key]
+        for table in metadata.sorted_tables:
+            _upgrade_table(engine, table)
+    stop_entry_id_reuse(db.engine, db.engines['archive'])
+    backfill_archived_route_ids(db.engine, db.engines['archive'])
+
 # Initialize database
 with app.app_context():
-    db.create_all()
+    upgrade_schema()
+
+def vehicle_to_dict(v):
+    return {
+        'id': v.id,
+        'name': v.name,
+        'default_rate': v.default_rate,
+        'created_at': v.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'archived': v.archived_at is not None
+    }
+
+def vehicles_with_summary(query, start_date=None, end_date=None):
+    """Return (vehicle, summary) pairs for the vehicles selected by query"""
+    # Embed per-vehicle totals with one grouped outer join; the period
+    # filter sits in the join so vehicles without trips still appear
+    join_on = [TransportEntry.vehicle_id == Vehicle.id]
+    if start_date:
+        join_on.append(TransportEntry.date >= start_date)
+    if end_date:
+        join_on.append(TransportEntry.date <= end_date)
+    
+    rows = query.outerjoin(TransportEntry, and_(*join_on)).group_by(Vehicle.id).with_entities(
+        Vehicle,
+        func.count(TransportEntry.id),
+        func.max(TransportEntry.date),
+        func.coalesce(func.sum(TransportEntry.km_driven), 0.0),
+        func.coalesce(func.sum(TransportEntry.extra), 0.0),
+        func.coalesce(func.sum(TransportEntry.total_amount), 0.0)
+    ).all()
+    
+    # The archive lives in another database, so its totals are grouped
+    # separately and added on top
+    archived_query = db.session.query(
+        ArchivedEntry.vehicle_id,
+        func.count(ArchivedEntry.id),
+        func.max(ArchivedEntry.date),
+        func.sum(ArchivedEntry.km_driven),
+        func.sum(ArchivedEntry.extra),
+        func.sum(ArchivedEntry.total_amount)
+    ).filter(ArchivedEntry.vehicle_id.in_([row[0].id for row in rows]))
+    if start_date:
+        archived_query = archived_query.filter(ArchivedEntry.date >= start_date)
+    if end_date:
+        archived_query = archived_query.filter(ArchivedEntry.date <= end_date)
+    archived = {row[0]: row[1:] for row in archived_query.group_by(ArchivedEntry.vehicle_id).all()}
+    
+    result = []
+    for vehicle, entry_count, last_trip, total_km, total_extra, total_amount in rows:
+        if vehicle.id in archived:
+            count, archived_last_trip, km, extra, amount = archived[vehicle.id]
+            entry_count += count
+            last_trip = max(last_trip or archived_last_trip, archived_last_trip)
+            total_km += km
+            total_extra += extra
+            total_amount += amount
+        result.append((vehicle, {
+            'entry_count': entry_count,
+            'last_trip_date': last_trip.strftime('%Y-%m-%d') if last_trip else None,
+            'total_km': total_km,
+            'total_extra': total_extra,
+            'total_amount': total_amount
+        }))
+    return result
+
+def entry_to_dict(e):
+    return {
+        'id': e.id,
+        'date': e.date.strftime('%Y-%m-%d'),
+        'route_id': e.route_id,
+        'route_name': e.route_name,
+        'km_driven': e.km_driven,
+        'rate': e.rate,
+        'amount': e.amount,
+        'extra': e.extra,
+        'total_amount': e.total_amount,
+        'version': e.version
+    }
+
+# Time of the last sweep for expired idempotency keys in this process
+_last_key_sweep = datetime.min
+
+def find_idempotent_response(key, request_hash):
+    """Return the stored response for a replayed key, or None"""
+    ttl = timedelta(hours=app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+    record = db.session.get(IdempotencyKey, key)
+    if record is None or record.created_at < datetime.utcnow() - ttl:
+        return None
+    if record.request_hash != request_hash:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    response = app.response_class(record.response, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def store_idempotent_response(key, request_hash, payload, status_code):
+    """Record the response for key in the current transaction.
+    
+    Returns False if an unexpired record for key already exists, meaning
+    a concurrent retry got there first.
+    """
+    global _last_key_sweep
+    now = datetime.utcnow()
+    ttl = timedelta(hours=app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+    
+    # Evict expired keys at most once per ttl/24 instead of on every write
+    if now - _last_key_sweep > ttl / 24:
+        IdempotencyKey.query.filter(IdempotencyKey.created_at < now - ttl).delete(synchronize_session=False)
+        _last_key_sweep = now
+    
+    values = {
+        'key': key,
+        'request_hash': request_hash,
+        'status_code': status_code,
+        'response': json.dumps(payload),
+        'created_at': now
+    }
+    # Only an expired record may be overwritten
+    result = db.session.execute(
+        sqlite_insert(IdempotencyKey).values(**values).on_conflict_do_update(
+            index_elements=['key'],
+            set_=values,
+            where=IdempotencyKey.created_at < now - ttl
+        )
+    )
+    return result.rowcount == 1
+
+def route_to_dict(r):
+    return {
+        'id': r.id,
+        'name': r.name,
+        'default_km': r.default_km,
+        'default_rate': r.default_rate
+    }
+
+def get_or_create_route(name):
+    """Return the route called name, adding it to the route master if new"""
+    name = name.strip()
+    db.session.execute(
+        sqlite_insert(Route).values(name=name, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=['name'])
+    )
+    return Route.query.filter_by(name=name).one()
+
+def route_from_request(data):
+    """Resolve the route of an entry payload given by route_id or route_name"""
+    if data.get('route_id') is not None:
+        return Route.query.get_or_404(int(data['route_id']))
+    return get_or_create_route(data['route_name'])
+
+def record_change(entity, entity_id, vehicle_id, op='upsert'):
+    """Add a change feed row to the current transaction"""
+    db.session.add(ChangeLog(entity=entity, entity_id=entity_id, vehicle_id=vehicle_id, op=op))
+
+def record_entry_change(entry_id, vehicle_id, op='upsert'):
+    # The vehicle's embedded totals change with its entries
+    record_change('entry', entry_id, vehicle_id, op)
+    record_change('vehicle', vehicle_id, vehicle_id)
+
+def entries_in_range(vehicle_ids, start_date, end_date):
+    """Return live and archived entries ordered by vehicle and date.
+    
+    Rows are streamed in batches, so the result can be consumed lazily.
+    """
+    queries = [
+        model.query.filter(
+            model.vehicle_id.in_(vehicle_ids),
+            model.date >= start_date,
+            model.date <= end_date
+        ).order_by(model.vehicle_id, model.date, model.id).yield_per(1000)
+        for model in (TransportEntry, ArchivedEntry)
+    ]
+    return heapq.merge(*queries, key=lambda e: (e.vehicle_id, e.date, e.id))
+
+def archive_entries(cutoff, batch_size=1000):
+    """Move entries dated before cutoff into the archive database.
+    
+    Each batch is copied first and deleted from the live table afterwards,
+    so an interrupted run can simply be repeated. A different entry already
+    archived under the same id raises instead of being deleted unarchived.
+    Entries edited after being copied stay live and are picked up again.
+    """
+    columns = [
+        Route.name.label(name) if name == 'route_name' else getattr(TransportEntry, name)
+        for name in ARCHIVE_COLUMNS
+    ]
+    moved = 0
+    while True:
+        rows = db.session.query(*columns, TransportEntry.version).join(Route, TransportEntry.route_id == Route.id).filter(
+            TransportEntry.date < cutoff
+        ).order_by(TransportEntry.id).limit(batch_size).all()
+        if not rows:
+            return moved
+        
+        ids = [row.id for row in rows]
+        copied = dict(db.session.query(ArchivedEntry.id, ArchivedEntry.created_at).filter(
+            ArchivedEntry.id.in_(ids)
+        ).all())
+        for row in rows:
+            if row.id in copied and copied[row.id] != row.created_at:
+                db.session.rollback()
+                raise RuntimeError(f'Entry {row.id} conflicts with a different archived entry; nothing was deleted')
+        
+        # Copies left by an interrupted run are replaced with the current rows
+        ArchivedEntry.query.filter(ArchivedEntry.id.in_(list(copied))).delete(synchronize_session=False)
+        db.session.execute(ArchivedEntry.__table__.insert(), [dict(zip(ARCHIVE_COLUMNS, row)) for row in rows])
+        db.session.commit()
+        
+        # Only delete the version that was copied; an update committed in
+        # between keeps the entry live and its stale copy is dropped
+        db.session.execute(
+            TransportEntry.__table__.delete().where(
+                TransportEntry.id == bindparam('entry_id'),
+                TransportEntry.version == bindparam('entry_version')
+            ),
+            [{'entry_id': row.id, 'entry_version': row.version} for row in rows]
+        )
+        changed = {id for id, in db.session.query(TransportEntry.id).filter(TransportEntry.id.in_(ids))}
+        if changed:
+            ArchivedEntry.query.filter(ArchivedEntry.id.in_(list(changed))).delete(synchronize_session=False)
+        rows = [row for row in rows if row.id not in changed]
+        if rows:
+            db.session.execute(ChangeLog.__table__.insert(), [
+                {'entity': 'entry', 'entity_id': row.id, 'vehicle_id': row.vehicle_id,
+                 'op': 'delete', 'created_at': datetime.utcnow()}
+                for row in rows
+            ])
+        db.session.commit()
+        moved += len(rows)
+
+@app.cli.command('archive-entries')
+@click.option('--before', help='Archive entries dated before this day (YYYY-MM-DD)')
+@click.option('--vacuum', is_flag=True, help='Reclaim space in the live database afterwards')
+def archive_entries_command(before, vacuum):
+    """Move old transport entries into the archive database"""
+    if before:
+        cutoff = datetime.strptime(before, '%Y-%m-%d').date()
+    else:
+        cutoff = datetime.utcnow().date() - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])
+    try:
+        moved = archive_entries(cutoff)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'Archived {moved} entries dated before {cutoff}')
+    if vacuum:
+        with db.engine.connect() as conn:
+            conn.execute(text('VACUUM'))
+
+def run_due_reports(now):
+    """Render every active schedule whose next run time has passed"""
+    rendered = 0
+    due = ReportSchedule.query.filter(
+        ReportSchedule.active.is_(True),
+        ReportSchedule.next_run_at <= now
+    ).order_by(ReportSchedule.next_run_at).all()
+    for schedule in due:
+        vehicle = db.session.get(Vehicle, schedule.vehicle_id)
+        start_date, end_date = report_period(schedule.period_rule, schedule.next_run_at.date())
+        change_seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        entries = list(entries_in_range([vehicle.id], start_date, end_date))
+        if entries:
+            path = generate_pdf(vehicle, entries, schedule.from_address, schedule.to_address, start_date, end_date)
+            db.session.add(RenderedReport(
+                schedule_id=schedule.id,
+                vehicle_id=vehicle.id,
+                start_date=start_date,
+                end_date=end_date,
+                from_address=schedule.from_address,
+                to_address=schedule.to_address,
+                path=os.path.relpath(path, app.root_path),
+                change_seq=change_seq
+            ))
+            rendered += 1
+        schedule.last_run_at = now
+        # Advance one period at a time so missed periods catch up on later runs
+        schedule.next_run_at = next_run_at(schedule.period_rule, schedule.next_run_at,
+                                           app.config['REPORT_OFFPEAK_HOURS'][0])
+        db.session.commit()
+    return rendered
+
+def rendered_report_path(report):
+    # Stored relative to the app so the install directory can move
+    return os.path.join(app.root_path, report.path)
+
+def find_rendered_report(vehicle_id, start_date, end_date, from_address, to_address):
+    """Return a pre-rendered report that is still current, or None"""
+    report = RenderedReport.query.filter_by(
+        vehicle_id=vehicle_id,
+        start_date=start_date,
+        end_date=end_date,
+        from_address=from_address,
+        to_address=to_address
+    ).order_by(RenderedReport.id.desc()).first()
+    if report is None or not os.path.exists(rendered_report_path(report)):
+        return None
+    
+    # Stale if the vehicle changed since rendering, or if the change log
+    # was pruned past the render point and that can no longer be told
+    oldest = db.session.query(func.min(ChangeLog.seq)).scalar()
+    if oldest is not None and oldest > report.change_seq + 1:
+        return None
+    changed = db.session.query(ChangeLog.query.filter(
+        ChangeLog.vehicle_id == vehicle_id,
+        ChangeLog.seq > report.change_seq
+    ).exists()).scalar()
+    return None if changed else report
+
+def schedule_to_dict(schedule):
+    return {
+        'id': schedule.id,
+        'vehicle_id': schedule.vehicle_id,
+        'period_rule': schedule.period_rule,
+        'from_address': schedule.from_address,
+        'to_address': schedule.to_address,
+        'active': schedule.active,
+        'next_run_at': schedule.next_run_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'last_run_at': schedule.last_run_at.strftime('%Y-%m-%d %H:%M:%S') if schedule.last_run_at else None
+    }
+
+@app.cli.command('run-scheduled-reports')
+@click.option('--force', is_flag=True, help='Run now even outside the off-peak window')
+def run_scheduled_reports_command(force):
+    """Pre-render due scheduled reports; meant to be run from cron"""
+    now = datetime.now()
+    start_hour, end_hour = app.config['REPORT_OFFPEAK_HOURS']
+    if not force and not in_offpeak_window(now, (start_hour, end_hour)):
+        click.echo(f'Outside the off-peak window ({start_hour}:00-{end_hour}:00); use --force to run anyway')
+        return
+    click.echo(f'Rendered {run_due_reports(now)} scheduled reports')
+
+@app.cli.command('prune-changes')
+@click.option('--days', type=int, help='Keep changes newer than this many days')
+def prune_changes_command(days):
+    """Delete old change feed rows; clients behind them must resync"""
+    days = days if days is not None else app.config['CHANGE_LOG_RETENTION_DAYS']
+    latest = db.session.query(func.max(ChangeLog.seq)).scalar()
+    # Always keep the newest row so the feed head stays known
+    pruned = ChangeLog.query.filter(
+        ChangeLog.created_at < datetime.utcnow() - timedelta(days=days),
+        ChangeLog.seq < (latest or 0)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Pruned {pruned} changes')
+
+@functools.lru_cache(maxsize=64)
+def _file_fingerprint(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+def static_fingerprint(filename):
+    path = os.path.join(app.static_folder, filename)
+    return _file_fingerprint(path, os.path.getmtime(path))
+
+@app.context_processor
+def inject_static_url():
+    def static_url(filename):
+        """URL of a static file that changes whenever the file does"""
+        return url_for('static', filename=filename, v=static_fingerprint(filename))
+    return {'static_url': static_url}
+
+# Compressed static files keyed by (filename, fingerprint, encoding)
+_compressed_static = {}
+
+@app.after_request
+def optimize_response(response):
+    is_static = request.endpoint == 'static'
+    if is_static and response.status_code in (200, 304):
+        filename = request.view_args['filename']
+        if request.args.get('v') == static_fingerprint(filename):
+            # Fingerprinted URLs never change content, so cache them for good
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+    elif request.endpoint == 'index':
+        # The page must be revalidated so new asset fingerprints are seen
+        response.headers['Cache-Control'] = 'no-cache'
+    
+    if (response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in app.config['COMPRESS_MIMETYPES']
+            or (response.content_length or 0) < app.config['COMPRESS_MIN_SIZE']):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    
+    if is_static:
+        filename = request.view_args['filename']
+        compress_response(response, encoding, _compressed_static,
+                          (filename, static_fingerprint(filename), encoding))
+        # Re-check If-None-Match against the compressed variant's ETag
+        return response.make_conditional(request)
+    return compress_response(response, encoding)
 
 # Routes
 @app.route('/')
@@ -41,14 +706,27 @@ def index():
     return render_template('index.html')
 
 @app.route('/api/vehicles', methods=['GET'])
+@limiter.limit('listings')
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    return jsonify([{
-        'id': v.id,
-        'name': v.name,
-        'default_rate': v.default_rate,
-        'created_at': v.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    } for v in vehicles])
+    query = Vehicle.query
+    if request.args.get('include_archived') != '1':
+        query = query.filter(Vehicle.archived_at.is_(None))
+    
+    if request.args.get('summary') != '1':
+        return jsonify([vehicle_to_dict(v) for v in query.all()])
+    
+    start_date = end_date = None
+    if request.args.get('start_date'):
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+    if request.args.get('end_date'):
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+    
+    result = []
+    for vehicle, summary in vehicles_with_summary(query, start_date, end_date):
+        data = vehicle_to_dict(vehicle)
+        data['summary'] = summary
+        result.append(data)
+    return jsonify(result)
 
 @app.route('/api/vehicles', methods=['POST'])
 def create_vehicle():
@@ -58,6 +736,8 @@ def create_vehicle():
         default_rate=data.get('default_rate', 0.0)
     )
     db.session.add(vehicle)
+    db.session.flush()
+    record_change('vehicle', vehicle.id, vehicle.id)
     db.session.commit()
     return jsonify({
         'id': vehicle.id,
@@ -72,6 +752,7 @@ def update_vehicle(vehicle_id):
     data = request.json
     vehicle.name = data.get('name', vehicle.name)
     vehicle.default_rate = data.get('default_rate', vehicle.default_rate)
+    record_change('vehicle', vehicle.id, vehicle.id)
     db.session.commit()
     return jsonify({
         'id': vehicle.id,
@@ -83,40 +764,108 @@ def update_vehicle(vehicle_id):
 @app.route('/api/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
     vehicle = Vehicle.query.get_or_404(vehicle_id)
-    db.session.delete(vehicle)
+    
+    # Archive mode only hides the vehicle; it can be restored later
+    if request.args.get('mode') == 'archive':
+        vehicle.archived_at = datetime.utcnow()
+        record_change('vehicle', vehicle.id, vehicle.id)
+        db.session.commit()
+        return jsonify({'message': 'Vehicle archived successfully'})
+    
+    # Delete entries with one set-based statement instead of loading them.
+    # Databases created before ON DELETE CASCADE existed still need this.
+    TransportEntry.query.filter_by(vehicle_id=vehicle_id).delete(synchronize_session=False)
+    ArchivedEntry.query.filter_by(vehicle_id=vehicle_id).delete(synchronize_session=False)
+    Vehicle.query.filter_by(id=vehicle_id).delete(synchronize_session=False)
+    # Clients drop the vehicle's entries along with its tombstone
+    record_change('vehicle', vehicle_id, vehicle_id, 'delete')
     db.session.commit()
     return jsonify({'message': 'Vehicle deleted successfully'})
 
+@app.route('/api/vehicles/<int:vehicle_id>/restore', methods=['POST'])
+def restore_vehicle(vehicle_id):
+    vehicle = Vehicle.query.get_or_404(vehicle_id)
+    vehicle.archived_at = None
+    record_change('vehicle', vehicle.id, vehicle.id)
+    db.session.commit()
+    return jsonify({
+        'id': vehicle.id,
+        'name': vehicle.name,
+        'default_rate': vehicle.default_rate,
+        'message': 'Vehicle restored successfully'
+    })
+
 @app.route('/api/vehicles/<int:vehicle_id>/entries', methods=['GET'])
+@limiter.limit('listings')
 def get_entries(vehicle_id):
-    entries = TransportEntry.query.filter_by(vehicle_id=vehicle_id).order_by(TransportEntry.date.desc()).all()
-    return jsonify([{
-        'id': e.id,
-        'date': e.date.strftime('%Y-%m-%d'),
-        'route_name': e.route_name,
-        'km_driven': e.km_driven,
-        'rate': e.rate,
-        'amount': e.amount,
-        'extra': e.extra,
-        'total_amount': e.total_amount
-    } for e in entries])
+    query = TransportEntry.query.filter_by(vehicle_id=vehicle_id).order_by(
+        TransportEntry.date.desc(), TransportEntry.id.desc()
+    )
+    if 'limit' not in request.args:
+        return jsonify([entry_to_dict(e) for e in query.all()])
+    
+    # Keyset pagination: the cursor is the (date, id) of the last row sent,
+    # so every page is an index range scan however deep the client scrolls
+    try:
+        limit = max(1, min(int(request.args['limit']), 1000))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if request.args.get('cursor'):
+        try:
+            cursor_date, cursor_id = request.args['cursor'].split(':')
+            cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+            cursor_id = int(cursor_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(or_(
+            TransportEntry.date < cursor_date,
+            and_(TransportEntry.date == cursor_date, TransportEntry.id < cursor_id)
+        ))
+    entries = query.limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = f"{entries[-1].date.strftime('%Y-%m-%d')}:{entries[-1].id}"
+    return jsonify({
+        'entries': [entry_to_dict(e) for e in entries],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/vehicles/<int:vehicle_id>/entries', methods=['POST'])
 def create_entry(vehicle_id):
     vehicle = Vehicle.query.get_or_404(vehicle_id)
     data = request.json
     
+    # Retried submissions with the same key get the original response
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        if len(idempotency_key) > 64:
+            return jsonify({'error': 'Idempotency-Key must be at most 64 characters'}), 400
+        request_hash = hashlib.sha256(f'{vehicle_id}:{request.get_data(as_text=True)}'.encode()).hexdigest()
+        replay = find_idempotent_response(idempotency_key, request_hash)
+        if replay is not None:
+            return replay
+    
+    # Distance and rate fall back to the route's, then the vehicle's defaults
+    route = route_from_request(data)
+    km_driven = data.get('km_driven', route.default_km)
+    rate = data.get('rate', route.default_rate if route.default_rate is not None else vehicle.default_rate)
+    if km_driven is None or rate is None:
+        db.session.rollback()
+        return jsonify({'error': 'km_driven and rate are required when the route has no defaults'}), 400
+    
     # Calculate amount and total
-    km_driven = float(data['km_driven'])
-    rate = float(data['rate'])
-    extra = float(data.get('extra', 0.0))
+    km_driven = float(km_driven)
+    rate = float(rate)
+    extra = float(data.get('extra') or 0.0)
     amount = km_driven * rate
     total_amount = amount + extra
     
     entry = TransportEntry(
         vehicle_id=vehicle_id,
         date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-        route_name=data['route_name'],
+        route=route,
         km_driven=km_driven,
         rate=rate,
         amount=amount,
@@ -124,58 +873,93 @@ def create_entry(vehicle_id):
         total_amount=total_amount
     )
     db.session.add(entry)
+    db.session.flush()
+    record_entry_change(entry.id, vehicle_id)
+    
+    result = entry_to_dict(entry)
+    result['message'] = 'Entry added successfully'
+    
+    if idempotency_key and not store_idempotent_response(idempotency_key, request_hash, result, 201):
+        # A concurrent retry with the same key committed first
+        db.session.rollback()
+        return find_idempotent_response(idempotency_key, request_hash)
     db.session.commit()
     
-    return jsonify({
-        'id': entry.id,
-        'date': entry.date.strftime('%Y-%m-%d'),
-        'route_name': entry.route_name,
-        'km_driven': entry.km_driven,
-        'rate': entry.rate,
-        'amount': entry.amount,
-        'extra': entry.extra,
-        'total_amount': entry.total_amount,
-        'message': 'Entry added successfully'
-    }), 201
+    return jsonify(result), 201
 
-@app.route('/api/vehicles/<int:vehicle_id>/entries/<int:entry_id>', methods=['PUT'])
+@app.route('/api/vehicles/<int:vehicle_id>/entries/<int:entry_id>', methods=['PUT', 'PATCH'])
 def update_entry(vehicle_id, entry_id):
-    entry = TransportEntry.query.filter_by(id=entry_id, vehicle_id=vehicle_id).first_or_404()
     data = request.json
     
-    # Update fields
-    entry.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
-    entry.route_name = data['route_name']
-    entry.km_driven = float(data['km_driven'])
-    entry.rate = float(data['rate'])
-    entry.extra = float(data.get('extra', 0.0))
+    # Compare-and-swap on version when the client says which one it edited;
+    # If-Match: * matches any version
+    expected_version = data.get('version')
+    if expected_version is None:
+        if_match = request.headers.get('If-Match', '').strip()
+        if if_match and if_match != '*':
+            expected_version = if_match.strip('"')
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'version must be an integer'}), 400
+    
+    # PUT replaces every field; PATCH only sends the ones that changed
+    values = {}
+    if request.method == 'PUT' or 'date' in data:
+        values['date'] = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    if request.method == 'PUT' or 'route_name' in data or 'route_id' in data:
+        values['route_id'] = route_from_request(data).id
+    if request.method == 'PUT' or 'km_driven' in data:
+        values['km_driven'] = float(data['km_driven'])
+    if request.method == 'PUT' or 'rate' in data:
+        values['rate'] = float(data['rate'])
+    if request.method == 'PUT' or 'extra' in data:
+        values['extra'] = float(data.get('extra') or 0.0)
+    
+    # Recalculate amounts in the same statement; fields not being changed
+    # are taken from the row as stored
+    km_driven = values.get('km_driven', TransportEntry.km_driven)
+    rate = values.get('rate', TransportEntry.rate)
+    extra = values.get('extra', TransportEntry.extra)
+    values['amount'] = km_driven * rate
+    values['total_amount'] = km_driven * rate + extra
+    values['version'] = TransportEntry.version + 1
     
-    # Recalculate amounts
-    entry.amount = entry.km_driven * entry.rate
-    entry.total_amount = entry.amount + entry.extra
+    conditions = [TransportEntry.id == entry_id, TransportEntry.vehicle_id == vehicle_id]
+    if expected_version is not None:
+        conditions.append(TransportEntry.version == expected_version)
     
+    result = db.session.execute(
+        update(TransportEntry).where(*conditions).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        entry = TransportEntry.query.filter_by(id=entry_id, vehicle_id=vehicle_id).first_or_404()
+        return jsonify({
+            'error': 'Entry was changed by someone else; reload it and try again',
+            'current': entry_to_dict(entry)
+        }), 409
+    
+    record_entry_change(entry_id, vehicle_id)
     db.session.commit()
     
-    return jsonify({
-        'id': entry.id,
-        'date': entry.date.strftime('%Y-%m-%d'),
-        'route_name': entry.route_name,
-        'km_driven': entry.km_driven,
-        'rate': entry.rate,
-        'amount': entry.amount,
-        'extra': entry.extra,
-        'total_amount': entry.total_amount,
-        'message': 'Entry updated successfully'
-    })
+    entry = TransportEntry.query.filter_by(id=entry_id).populate_existing().one()
+    result = entry_to_dict(entry)
+    result['message'] = 'Entry updated successfully'
+    return jsonify(result)
 
 @app.route('/api/vehicles/<int:vehicle_id>/entries/<int:entry_id>', methods=['DELETE'])
 def delete_entry(vehicle_id, entry_id):
     entry = TransportEntry.query.filter_by(id=entry_id, vehicle_id=vehicle_id).first_or_404()
     db.session.delete(entry)
+    record_entry_change(entry_id, vehicle_id, 'delete')
     db.session.commit()
     return jsonify({'message': 'Entry deleted successfully'})
 
 @app.route('/api/vehicles/<int:vehicle_id>/generate-pdf', methods=['POST'])
+@limiter.limit('reports')
 def generate_vehicle_pdf(vehicle_id):
     vehicle = Vehicle.query.get_or_404(vehicle_id)
     data = request.json
@@ -185,12 +969,15 @@ def generate_vehicle_pdf(vehicle_id):
     from_address = data.get('from_address', '')
     to_address = data.get('to_address', '')
     
-    # Get entries in date range
-    entries = TransportEntry.query.filter(
-        TransportEntry.vehicle_id == vehicle_id,
-        TransportEntry.date >= start_date,
-        TransportEntry.date <= end_date
-    ).order_by(TransportEntry.date).all()
+    download_name = f'{vehicle.name}_report_{start_date}_to_{end_date}.pdf'
+    
+    # Serve a scheduled pre-render when nothing has changed since
+    report = find_rendered_report(vehicle_id, start_date, end_date, from_address, to_address)
+    if report is not None:
+        return send_file(rendered_report_path(report), as_attachment=True, download_name=download_name)
+    
+    # Get entries in date range, including any that were archived
+    entries = list(entries_in_range([vehicle_id], start_date, end_date))
     
     if not entries:
         return jsonify({'error': 'No entries found for the selected date range'}), 404
@@ -198,7 +985,277 @@ def generate_vehicle_pdf(vehicle_id):
     # Generate PDF
     pdf_path = generate_pdf(vehicle, entries, from_address, to_address, start_date, end_date)
     
-    return send_file(pdf_path, as_attachment=True, download_name=f'{vehicle.name}_report_{start_date}_to_{end_date}.pdf')
+    return send_file(pdf_path, as_attachment=True, download_name=download_name)
+
+@app.route('/api/reports/consolidated', methods=['POST'])
+@limiter.limit('reports')
+def generate_consolidated_report():
+    data = request.json
+    vehicle_ids = [int(v) for v in data.get('vehicle_ids', [])]
+    if not vehicle_ids:
+        return jsonify({'error': 'Select at least one vehicle'}), 400
+    
+    vehicles = {v.id: v for v in Vehicle.query.filter(Vehicle.id.in_(vehicle_ids)).all()}
+    missing = set(vehicle_ids) - set(vehicles)
+    if missing:
+        return jsonify({'error': f'Unknown vehicle ids: {sorted(missing)}'}), 404
+    
+    start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+    end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+    
+    # Peek at the stream so an empty report is refused without rendering
+    entries = entries_in_range(vehicle_ids, start_date, end_date)
+    first = next(entries, None)
+    if first is None:
+        return jsonify({'error': 'No entries found for the selected date range'}), 404
+    
+    pdf_path = generate_consolidated_pdf(
+        vehicles, itertools.chain([first], entries),
+        data.get('from_address', ''), data.get('to_address', ''), start_date, end_date
+    )
+    
+    return send_file(pdf_path, as_attachment=True, download_name=f'consolidated_report_{start_date}_to_{end_date}.pdf')
+
+@app.route('/api/report-schedules', methods=['GET'])
+def get_report_schedules():
+    query = ReportSchedule.query
+    if request.args.get('vehicle_id'):
+        query = query.filter_by(vehicle_id=int(request.args['vehicle_id']))
+    return jsonify([schedule_to_dict(s) for s in query.order_by(ReportSchedule.id).all()])
+
+@app.route('/api/report-schedules', methods=['POST'])
+def create_report_schedule():
+    data = request.json
+    vehicle = Vehicle.query.get_or_404(data['vehicle_id'])
+    if data['period_rule'] not in PERIOD_RULES:
+        return jsonify({'error': f"period_rule must be one of {', '.join(PERIOD_RULES)}"}), 400
+    
+    schedule = ReportSchedule(
+        vehicle_id=vehicle.id,
+        period_rule=data['period_rule'],
+        from_address=data.get('from_address', ''),
+        to_address=data.get('to_address', ''),
+        next_run_at=next_run_at(data['period_rule'], datetime.now(), app.config['REPORT_OFFPEAK_HOURS'][0])
+    )
+    db.session.add(schedule)
+    db.session.commit()
+    result = schedule_to_dict(schedule)
+    result['message'] = 'Report schedule created successfully'
+    return jsonify(result), 201
+
+@app.route('/api/report-schedules/<int:schedule_id>', methods=['DELETE'])
+def delete_report_schedule(schedule_id):
+    schedule = ReportSchedule.query.get_or_404(schedule_id)
+    db.session.delete(schedule)
+    db.session.commit()
+    return jsonify({'message': 'Report schedule deleted successfully'})
+
+@app.route('/api/reports', methods=['GET'])
+def get_rendered_reports():
+    query = RenderedReport.query
+    if request.args.get('vehicle_id'):
+        query = query.filter_by(vehicle_id=int(request.args['vehicle_id']))
+    return jsonify([{
+        'id': r.id,
+        'schedule_id': r.schedule_id,
+        'vehicle_id': r.vehicle_id,
+        'start_date': r.start_date.strftime('%Y-%m-%d'),
+        'end_date': r.end_date.strftime('%Y-%m-%d'),
+        'created_at': r.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    } for r in query.order_by(RenderedReport.id.desc()).all()])
+
+@app.route('/api/reports/<int:report_id>/download', methods=['GET'])
+def download_rendered_report(report_id):
+    report = RenderedReport.query.get_or_404(report_id)
+    vehicle = Vehicle.query.get_or_404(report.vehicle_id)
+    path = rendered_report_path(report)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Report file not found; generate the report again'}), 404
+    return send_file(path, as_attachment=True,
+                     download_name=f'{vehicle.name}_report_{report.start_date}_to_{report.end_date}.pdf')
+
+@app.route('/api/routes', methods=['GET'])
+def get_routes():
+    return jsonify([route_to_dict(r) for r in Route.query.order_by(Route.name).all()])
+
+@app.route('/api/routes', methods=['POST'])
+def create_route():
+    data = request.json
+    name = data['name'].strip()
+    if Route.query.filter_by(name=name).first():
+        return jsonify({'error': 'A route with this name already exists'}), 409
+    route = Route(name=name, default_km=data.get('default_km'), default_rate=data.get('default_rate'))
+    db.session.add(route)
+    db.session.commit()
+    result = route_to_dict(route)
+    result['message'] = 'Route created successfully'
+    return jsonify(result), 201
+
+@app.route('/api/routes/<int:route_id>', methods=['PUT'])
+def update_route(route_id):
+    route = Route.query.get_or_404(route_id)
+    data = request.json
+    if 'name' in data:
+        name = data['name'].strip()
+        if Route.query.filter(Route.name == name, Route.id != route_id).first():
+            return jsonify({'error': 'A route with this name already exists'}), 409
+        if name != route.name:
+            # One route change per vehicle with entries on it; clients patch
+            # the name into cached rows, and the rows make pre-rendered
+            # reports for those vehicles stale
+            db.session.execute(ChangeLog.__table__.insert().from_select(
+                ['entity', 'entity_id', 'vehicle_id', 'op', 'created_at'],
+                select(literal('route'), literal(route_id), TransportEntry.vehicle_id,
+                       literal('upsert'), literal(datetime.utcnow(), db.DateTime))
+                .where(TransportEntry.route_id == route_id).distinct()
+            ))
+        route.name = name
+    route.default_km = data.get('default_km', route.default_km)
+    route.default_rate = data.get('default_rate', route.default_rate)
+    db.session.commit()
+    result = route_to_dict(route)
+    result['message'] = 'Route updated successfully'
+    return jsonify(result)
+
+@app.route('/api/changes', methods=['GET'])
+@limiter.limit('listings')
+def get_changes():
+    latest = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+    if 'since' not in request.args:
+        # Feed head for clients about to do a full load
+        return jsonify({'changes': [], 'next_since': latest, 'has_more': False})
+    
+    try:
+        since = int(request.args['since'])
+        limit = max(1, min(int(request.args.get('limit', 500)), 5000))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    oldest = db.session.query(func.min(ChangeLog.seq)).scalar()
+    if oldest is not None and since < oldest - 1:
+        return jsonify({'error': 'Changes since this point were pruned; reload everything'}), 410
+    
+    rows = ChangeLog.query.filter(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    # Only the last change per record matters to the client
+    latest_changes = {}
+    for row in rows:
+        latest_changes.pop((row.entity, row.entity_id), None)
+        latest_changes[(row.entity, row.entity_id)] = row
+    
+    upserted = {'vehicle': [], 'entry': [], 'route': []}
+    for (entity, entity_id), row in latest_changes.items():
+        if row.op == 'upsert':
+            upserted[entity].append(entity_id)
+    vehicles = {}
+    if upserted['vehicle']:
+        query = Vehicle.query.filter(Vehicle.id.in_(upserted['vehicle']))
+        for vehicle, summary in vehicles_with_summary(query):
+            data = vehicle_to_dict(vehicle)
+            data['summary'] = summary
+            vehicles[vehicle.id] = data
+    entries = {}
+    if upserted['entry']:
+        for entry in TransportEntry.query.filter(TransportEntry.id.in_(upserted['entry'])):
+            entries[entry.id] = entry_to_dict(entry)
+    routes = {}
+    if upserted['route']:
+        routes = {r.id: route_to_dict(r) for r in Route.query.filter(Route.id.in_(upserted['route']))}
+    current = {'vehicle': vehicles, 'entry': entries, 'route': routes}
+    
+    changes = []
+    for (entity, entity_id), row in latest_changes.items():
+        change = {
+            'seq': row.seq,
+            'entity': entity,
+            'id': entity_id,
+            'vehicle_id': row.vehicle_id,
+            'op': row.op
+        }
+        if row.op == 'upsert':
+            if entity_id not in current[entity]:
+                # Deleted after this page; its tombstone follows later
+                continue
+            change['data'] = current[entity][entity_id]
+        changes.append(change)
+    
+    return jsonify({
+        'changes': changes,
+        'next_since': rows[-1].seq if rows else max(since, latest),
+        'has_more': has_more
+    })
+
+@app.route('/api/analytics', methods=['GET'])
+@limiter.limit('reports')
+def get_analytics():
+    bucket = request.args.get('bucket', 'month')
+    group_by = request.args.get('group_by', 'vehicle')
+    if bucket not in BUCKET_PERIODS:
+        return jsonify({'error': 'bucket must be one of day, week, month'}), 400
+    if group_by not in ('vehicle', 'route'):
+        return jsonify({'error': 'group_by must be vehicle or route'}), 400
+    
+    # Aggregate in SQL so only one row per (key, period) leaves each
+    # database; live and archived buckets are then summed together
+    totals = {}
+    for model in (TransportEntry, ArchivedEntry):
+        period = BUCKET_PERIODS[bucket](model.date).label('period')
+        key = model.vehicle_id if group_by == 'vehicle' else model.route_id
+        query = db.session.query(
+            key.label('key'),
+            period,
+            func.sum(model.km_driven).label('km'),
+            func.sum(model.total_amount).label('revenue'),
+            func.count(model.id).label('trips')
+        )
+        if request.args.get('vehicle_id'):
+            query = query.filter(model.vehicle_id == int(request.args['vehicle_id']))
+        if request.args.get('start_date'):
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+            query = query.filter(model.date >= start_date)
+        if request.args.get('end_date'):
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+            query = query.filter(model.date <= end_date)
+        for row in query.group_by(key, period).all():
+            point = totals.setdefault((row.key, row.period), [0.0, 0.0, 0])
+            point[0] += row.km
+            point[1] += row.revenue
+            point[2] += row.trips
+    
+    if group_by == 'vehicle':
+        names = dict(db.session.query(Vehicle.id, Vehicle.name).all())
+    else:
+        names = dict(db.session.query(Route.id, Route.name).all())
+    
+    series = {}
+    ordered = sorted(totals.items(), key=lambda item: (str(names.get(item[0][0], item[0][0])), item[0][1]))
+    for (key, period), (km, revenue, trips) in ordered:
+        if key not in series:
+            series[key] = {
+                'key': key,
+                'name': names.get(key, key),
+                'points': []
+            }
+        series[key]['points'].append({
+            'period': period,
+            'km': km,
+            'revenue': revenue,
+            'trips': trips
+        })
+    
+    return jsonify({
+        'bucket': bucket,
+        'group_by': group_by,
+        'series': list(series.values())
+    })
 
 if __name__ == '__main__':
+    # With the debug reloader only the child process serves requests
+    if app.config['REPORT_SCHEDULER_ENABLED'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        def run_due_in_context(now):
+            with app.app_context():
+                run_due_reports(now)
+        start_scheduler_thread(run_due_in_context, app.config['REPORT_OFFPEAK_HOURS'],
+                               app.config['REPORT_SCHEDULER_INTERVAL_SECONDS'])
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,55 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Encodings in order of preference
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+def choose_encoding(accept_encoding):
+    """Pick the preferred encoding the client accepts, or None"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+def compress_response(response, encoding, cache=None, cache_key=None):
+    """Compress a buffered response body in place.
+
+    Static assets pass a cache_key so each file version is only
+    compressed once per encoding.
+    """
+    response.direct_passthrough = False
+    if cache is not None and cache_key in cache:
+        body = cache[cache_key]
+    else:
+        body = compress(response.get_data(), encoding)
+        if cache is not None:
+            cache[cache_key] = body
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # A compressed body is a different representation of the resource
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
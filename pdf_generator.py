@@ -6,35 +6,54 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
 import os
+import uuid
 from datetime import datetime
 
-def generate_pdf(vehicle, entries, from_address, to_address, start_date, end_date):
-    """Generate PDF report for transport entries"""
-    
-    # Create output directory if it doesn't exist
-    output_dir = 'generated_pdfs'
+# Data rows per table chunk in consolidated reports, so a single
+# huge table never has to be laid out at once
+CONSOLIDATED_CHUNK_ROWS = 500
+
+def _entry_row(entry):
+    return [
+        entry.date.strftime('%d/%m/%Y'),
+        entry.route_name,
+        f'{entry.km_driven:.2f}',
+        f'₹{entry.rate:.2f}',
+        f'₹{entry.amount:.2f}',
+        f'₹{entry.extra:.2f}',
+        f'₹{entry.total_amount:.2f}'
+    ]
+
+def _total_row(label, total_km, total_amount, total_extra, grand_total):
+    return [
+        label,
+        '',
+        f'{total_km:.2f}',
+        '',
+        f'₹{total_amount:.2f}',
+        f'₹{total_extra:.2f}',
+        f'₹{grand_total:.2f}'
+    ]
+
+def _output_path(name):
+    # Create output directory if it doesn't exist; anchored to this module
+    # so runs started from cron or another directory write to the same place
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated_pdfs')
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Generate filename
+    # Generate filename; the random suffix keeps reports rendered in the
+    # same second from overwriting each other
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'{output_dir}/{vehicle.name}_{timestamp}.pdf'
-    
-    # Create PDF
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#333333'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
+    return os.path.join(output_dir, f'{name}_{timestamp}_{uuid.uuid4().hex[:8]}.pdf')
+
+def _build(story, filename):
+    # Write under a temporary name so a half-written file is never served
+    partial = f'{filename}.part'
+    SimpleDocTemplate(partial, pagesize=letter).build(story)
+    os.replace(partial, filename)
+
+def _address_header(from_address, to_address, styles):
     header_style = ParagraphStyle(
         'HeaderStyle',
         parent=styles['Normal'],
@@ -61,12 +80,90 @@ def generate_pdf(vehicle, entries, from_address, to_address, start_date, end_dat
         ('TOPPADDING', (0, 0), (-1, -1), 12),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
     ]))
+    return header_table
+
+def _title_style(styles):
+    return ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#333333'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+def _summary_style(styles):
+    return ParagraphStyle(
+        'Summary',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.HexColor('#333333'),
+        spaceAfter=6
+    )
+
+def _entries_table(table_data, has_total_row=True, repeat_header=False):
+    """Build the styled entries table; table_data starts with the header row"""
+    col_widths = [1*inch, 1.8*inch, 0.8*inch, 0.9*inch, 1.1*inch, 0.9*inch, 1.1*inch]
+    table = Table(table_data, colWidths=col_widths, repeatRows=1 if repeat_header else 0)
+    last_data_row = -2 if has_total_row else -1
     
-    story.append(header_table)
+    # Style table
+    style = [
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4CAF50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        
+        # Data rows
+        ('BACKGROUND', (0, 1), (-1, last_data_row), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, last_data_row), colors.black),
+        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),  # Align numbers to right
+        ('ALIGN', (0, 1), (1, -1), 'LEFT'),    # Align text to left
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+    ]
+    
+    if has_total_row:
+        style += [
+            # Total row
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#FFA726')),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.whitesmoke),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 10),
+            ('TOPPADDING', (0, -1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, -1), (-1, -1), 8),
+        ]
+    
+    style += [
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('BOX', (0, 0), (-1, -1), 2, colors.black),
+        
+        # Alternate row colors
+        ('ROWBACKGROUNDS', (0, 1), (-1, last_data_row), [colors.white, colors.lightgrey]),
+    ]
+    table.setStyle(TableStyle(style))
+    return table
+
+def generate_pdf(vehicle, entries, from_address, to_address, start_date, end_date):
+    """Generate PDF report for transport entries"""
+    
+    filename = _output_path(vehicle.name)
+    
+    # Create PDF
+    story = []
+    styles = getSampleStyleSheet()
+    
+    story.append(_address_header(from_address, to_address, styles))
     story.append(Spacer(1, 20))
     
     # Add title
-    title = Paragraph(f'Transport Report - {vehicle.name}', title_style)
+    title = Paragraph(f'Transport Report - {vehicle.name}', _title_style(styles))
     story.append(title)
     
     # Add date range
@@ -88,89 +185,118 @@ def generate_pdf(vehicle, entries, from_address, to_address, start_date, end_dat
     grand_total = 0
     
     for entry in entries:
-        table_data.append([
-            entry.date.strftime('%d/%m/%Y'),
-            entry.route_name,
-            f'{entry.km_driven:.2f}',
-            f'₹{entry.rate:.2f}',
-            f'₹{entry.amount:.2f}',
-            f'₹{entry.extra:.2f}',
-            f'₹{entry.total_amount:.2f}'
-        ])
+        table_data.append(_entry_row(entry))
         total_km += entry.km_driven
         total_amount += entry.amount
         total_extra += entry.extra
         grand_total += entry.total_amount
     
     # Add totals row
-    table_data.append([
-        'TOTAL',
-        '',
-        f'{total_km:.2f}',
-        '',
-        f'₹{total_amount:.2f}',
-        f'₹{total_extra:.2f}',
-        f'₹{grand_total:.2f}'
-    ])
-    
-    # Create table
-    col_widths = [1*inch, 1.8*inch, 0.8*inch, 0.9*inch, 1.1*inch, 0.9*inch, 1.1*inch]
-    table = Table(table_data, colWidths=col_widths)
-    
-    # Style table
-    table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4CAF50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Data rows
-        ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
-        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),  # Align numbers to right
-        ('ALIGN', (0, 1), (1, -1), 'LEFT'),    # Align text to left
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        
-        # Total row
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#FFA726')),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.whitesmoke),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 10),
-        ('TOPPADDING', (0, -1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, -1), (-1, -1), 8),
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('BOX', (0, 0), (-1, -1), 2, colors.black),
-        
-        # Alternate row colors
-        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.lightgrey]),
-    ]))
+    table_data.append(_total_row('TOTAL', total_km, total_amount, total_extra, grand_total))
     
-    story.append(table)
+    story.append(_entries_table(table_data))
     story.append(Spacer(1, 30))
     
     # Add summary
-    summary_style = ParagraphStyle(
-        'Summary',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#333333'),
-        spaceAfter=6
-    )
-    
+    summary_style = _summary_style(styles)
     story.append(Paragraph('<b>Summary:</b>', summary_style))
     story.append(Paragraph(f'Total Entries: {len(entries)}', summary_style))
     story.append(Paragraph(f'Total Kilometers: {total_km:.2f} km', summary_style))
     story.append(Paragraph(f'Total Amount: ₹{grand_total:.2f}', summary_style))
     
     # Build PDF
-    doc.build(story)
+    _build(story, filename)
+    
+    return filename
+
+def generate_consolidated_pdf(vehicles, entries, from_address, to_address, start_date, end_date):
+    """Generate one PDF for several vehicles with per-vehicle subtotals.
+    
+    `vehicles` maps vehicle id to vehicle; `entries` may be any iterator
+    ordered by vehicle and date. Entries are consumed one at a time and
+    only their formatted rows are kept.
+    """
+    
+    filename = _output_path('consolidated')
+    
+    story = []
+    styles = getSampleStyleSheet()
+    header = ['Date', 'Route', 'KM', 'Rate', 'Amount', 'Extra', 'Total']
+    
+    story.append(_address_header(from_address, to_address, styles))
+    story.append(Spacer(1, 20))
+    story.append(Paragraph('Consolidated Transport Report', _title_style(styles)))
+    story.append(Paragraph(
+        f'<b>Period:</b> {start_date.strftime("%d/%m/%Y")} to {end_date.strftime("%d/%m/%Y")}',
+        styles['Normal']
+    ))
+    story.append(Spacer(1, 20))
+    
+    vehicle_style = ParagraphStyle(
+        'VehicleHeading',
+        parent=styles['Heading2'],
+        fontSize=13,
+        textColor=colors.HexColor('#333333'),
+        spaceBefore=10,
+        spaceAfter=8
+    )
+    
+    grand = [0, 0, 0, 0]     # km, amount, extra, total
+    subtotals = []           # (vehicle name, entry count, km, total)
+    current_vehicle_id = None
+    rows = []
+    totals = None
+    count = 0
+    
+    def flush_rows(final):
+        # Close off a chunk of rows, adding the subtotal on the last one
+        if final:
+            rows.append(_total_row('SUBTOTAL', *totals))
+        if len(rows) > 1:
+            story.append(_entries_table(list(rows), has_total_row=final, repeat_header=True))
+        rows[1:] = []
+    
+    def finish_vehicle():
+        flush_rows(final=True)
+        subtotals.append((vehicles[current_vehicle_id].name, count, totals[0], totals[3]))
+        story.append(Spacer(1, 20))
+    
+    for entry in entries:
+        if entry.vehicle_id != current_vehicle_id:
+            if current_vehicle_id is not None:
+                finish_vehicle()
+            current_vehicle_id = entry.vehicle_id
+            story.append(Paragraph(vehicles[current_vehicle_id].name, vehicle_style))
+            rows[:] = [header]
+            totals = [0, 0, 0, 0]
+            count = 0
+        
+        rows.append(_entry_row(entry))
+        count += 1
+        for i, value in enumerate((entry.km_driven, entry.amount, entry.extra, entry.total_amount)):
+            totals[i] += value
+            grand[i] += value
+        if len(rows) > CONSOLIDATED_CHUNK_ROWS:
+            flush_rows(final=False)
+    
+    if current_vehicle_id is not None:
+        finish_vehicle()
+    
+    # Grand total across all vehicles
+    story.append(_entries_table([header, _total_row('GRAND TOTAL', *grand)]))
+    story.append(Spacer(1, 30))
+    
+    summary_style = _summary_style(styles)
+    story.append(Paragraph('<b>Summary:</b>', summary_style))
+    for name, vehicle_count, vehicle_km, vehicle_total in subtotals:
+        story.append(Paragraph(
+            f'{name}: {vehicle_count} entries, {vehicle_km:.2f} km, ₹{vehicle_total:.2f}',
+            summary_style
+        ))
+    story.append(Paragraph(f'Total Entries: {sum(s[1] for s in subtotals)}', summary_style))
+    story.append(Paragraph(f'Total Kilometers: {grand[0]:.2f} km', summary_style))
+    story.append(Paragraph(f'Total Amount: ₹{grand[3]:.2f}', summary_style))
+    
+    _build(story, filename)
     
     return filename
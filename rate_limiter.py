@@ -0,0 +1,132 @@
+from functools import wraps
+import math
+import sqlite3
+import threading
+import time
+
+from flask import jsonify, request
+
+# Idle buckets older than this are dropped once MemoryStorage grows large
+IDLE_BUCKET_SECONDS = 3600
+
+class MemoryStorage:
+    """Token buckets kept in this process"""
+
+    def __init__(self, max_buckets=10000):
+        self.buckets = {}
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > self.max_buckets:
+                self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < IDLE_BUCKET_SECONDS}
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens, retry_after = _refill_and_take(tokens, now - updated, rate, burst)
+            self.buckets[key] = (tokens, now)
+            return retry_after
+
+class SQLiteStorage:
+    """Token buckets in a local SQLite file, shared by all worker processes on the node"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so read-modify-write is atomic
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, retry_after = _refill_and_take(tokens, now - updated, rate, burst)
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+            return retry_after
+        finally:
+            conn.close()
+
+def _refill_and_take(tokens, elapsed, rate, burst):
+    tokens = min(burst, tokens + max(elapsed, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+class RateLimiter:
+    """Per-client token bucket rate limits and concurrency caps for groups of endpoints.
+
+    Limits are read from app.config['RATE_LIMITS'], keyed by group name:
+    rate (requests per second), burst, per_client_concurrency and
+    concurrency (across all clients). Concurrency is counted per process.
+    """
+
+    def __init__(self, app=None):
+        self.limits = {}
+        self.storage = MemoryStorage()
+        self.active = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limits = app.config.get('RATE_LIMITS', {})
+        if app.config.get('RATE_LIMIT_STORAGE'):
+            self.storage = SQLiteStorage(app.config['RATE_LIMIT_STORAGE'])
+
+    def _acquire(self, keys, caps):
+        with self.lock:
+            if any(self.active.get(key, 0) >= cap for key, cap in zip(keys, caps) if cap):
+                return False
+            for key in keys:
+                self.active[key] = self.active.get(key, 0) + 1
+            return True
+
+    def _release(self, keys):
+        with self.lock:
+            for key in keys:
+                self.active[key] -= 1
+                if not self.active[key]:
+                    # Drop idle clients so the map only holds requests in flight
+                    del self.active[key]
+
+    def limit(self, group):
+        """Decorate a view so it is limited by the settings for group"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                settings = self.limits.get(group)
+                if not settings:
+                    return view(*args, **kwargs)
+
+                client = request.remote_addr or 'unknown'
+                keys = (f'{group}:{client}', group)
+                caps = (settings.get('per_client_concurrency'), settings.get('concurrency'))
+                # Concurrency is checked first so requests turned away by
+                # the cap do not use up the client's rate budget
+                if not self._acquire(keys, caps):
+                    return _too_many_requests('Too many concurrent requests', 1)
+                try:
+                    if settings.get('rate'):
+                        retry_after = self.storage.take(f'{group}:{client}', settings['rate'], settings.get('burst', 1))
+                        if retry_after:
+                            return _too_many_requests('Rate limit exceeded', retry_after)
+                    return view(*args, **kwargs)
+                finally:
+                    self._release(keys)
+            return wrapper
+        return decorator
+
+def _too_many_requests(message, retry_after):
+    response = jsonify({'error': f'{message}, please retry later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta
+import logging
+import threading
+import time as time_module
+
+logger = logging.getLogger(__name__)
+
+# Supported period rules for scheduled reports
+PERIOD_RULES = ('monthly', 'weekly')
+
+def report_period(period_rule, run_date):
+    """Return (start_date, end_date) of the period a run on run_date reports on"""
+    if period_rule == 'monthly':
+        # The whole previous calendar month
+        end_date = run_date.replace(day=1) - timedelta(days=1)
+        return end_date.replace(day=1), end_date
+    if period_rule == 'weekly':
+        # The previous Monday to Sunday week
+        start_date = run_date - timedelta(days=run_date.weekday() + 7)
+        return start_date, start_date + timedelta(days=6)
+    raise ValueError(f'Unknown period rule: {period_rule}')
+
+def next_run_at(period_rule, after, offpeak_start_hour):
+    """Return the first run time strictly after `after` for the period rule"""
+    if period_rule == 'monthly':
+        run_date = after.date().replace(day=1)
+        candidate = datetime.combine(run_date, time(offpeak_start_hour))
+        if candidate <= after:
+            next_month = (run_date + timedelta(days=32)).replace(day=1)
+            candidate = datetime.combine(next_month, time(offpeak_start_hour))
+        return candidate
+    if period_rule == 'weekly':
+        run_date = after.date() - timedelta(days=after.weekday())
+        candidate = datetime.combine(run_date, time(offpeak_start_hour))
+        if candidate <= after:
+            candidate += timedelta(days=7)
+        return candidate
+    raise ValueError(f'Unknown period rule: {period_rule}')
+
+def in_offpeak_window(now, offpeak_hours):
+    """Check whether now falls in the [start, end) hour window, which may wrap midnight"""
+    start_hour, end_hour = offpeak_hours
+    if start_hour <= end_hour:
+        return start_hour <= now.hour < end_hour
+    return now.hour >= start_hour or now.hour < end_hour
+
+def start_scheduler_thread(run_due, offpeak_hours, interval_seconds):
+    """Call run_due(now) every interval while inside the off-peak window"""
+    def loop():
+        while True:
+            now = datetime.now()
+            if in_offpeak_window(now, offpeak_hours):
+                try:
+                    run_due(now)
+                except Exception:
+                    logger.exception('Scheduled report run failed')
+            time_module.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name='report-scheduler', daemon=True)
+    thread.start()
+    return thread
@@ -2,10 +2,23 @@
 let currentVehicleId = null;
 let vehicles = [];
 let entries = [];
+let routes = [];
+
+// Local cache kept current through the server change feed.
+// entryCache maps vehicle id to {rows, nextCursor, complete, loading}.
+let lastChangeSeq = 0;
+let entryCache = {};
+
+// Entries table virtualization
+const ENTRY_PAGE_SIZE = 200;
+const ENTRY_ROW_HEIGHT = 48;   // px, must match #entriesBody tr in index.html
+const ENTRY_OVERSCAN = 10;     // rows rendered above and below the viewport
+let entriesScrollFrame = null;
 
 // Initialize app
 document.addEventListener('DOMContentLoaded', function() {
     loadVehicles();
+    loadRoutes();
     
     // Set today's date as default
     const today = new Date().toISOString().split('T')[0];
@@ -17,14 +30,25 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('addEntryForm').addEventListener('submit', handleAddEntry);
     document.getElementById('editEntryForm').addEventListener('submit', handleEditEntry);
     document.getElementById('generatePdfForm').addEventListener('submit', handleGeneratePdf);
+    document.getElementById('consolidatedPdfForm').addEventListener('submit', handleConsolidatedPdf);
+    
+    // Re-render the visible window at most once per frame while scrolling
+    document.getElementById('entriesScroll').addEventListener('scroll', function() {
+        if (entriesScrollFrame) return;
+        entriesScrollFrame = requestAnimationFrame(() => {
+            entriesScrollFrame = null;
+            displayEntries();
+        });
+    });
 });
 
 // API calls
-async function apiCall(url, method = 'GET', data = null) {
+async function apiCall(url, method = 'GET', data = null, headers = {}) {
     const options = {
         method: method,
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            ...headers
         }
     };
     
@@ -33,9 +57,11 @@ async function apiCall(url, method = 'GET', data = null) {
     }
     
     try {
-        const response = await fetch(url, options);
+        const response = await fetchWithRetry(url, options);
         if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+            const error = new Error(`HTTP error! status: ${response.status}`);
+            error.status = response.status;
+            throw error;
         }
         return await response.json();
     } catch (error) {
@@ -45,9 +71,44 @@ async function apiCall(url, method = 'GET', data = null) {
     }
 }
 
+// Requests carrying an Idempotency-Key are safe to resend, so retry
+// them when the network drops instead of failing the submission.
+// Reads and idempotent writes also wait out a 429 Retry-After once.
+async function fetchWithRetry(url, options, attempts = 4) {
+    const retryable = options.method === 'GET' || Boolean(options.headers['Idempotency-Key']);
+    for (let attempt = 1; ; attempt++) {
+        let response;
+        try {
+            response = await fetch(url, options);
+        } catch (error) {
+            if (!options.headers['Idempotency-Key'] || attempt >= attempts) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            continue;
+        }
+        if (response.status !== 429 || !retryable || attempt >= 2) {
+            return response;
+        }
+        const retryAfter = parseInt(response.headers.get('Retry-After')) || 1;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+}
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // Vehicle functions
 async function loadVehicles() {
-    vehicles = await apiCall('/api/vehicles');
+    // Take the feed head first so no write made during the load is missed
+    const head = await apiCall('/api/changes');
+    // Summary totals come embedded so the overview needs one request
+    vehicles = await apiCall('/api/vehicles?summary=1');
+    lastChangeSeq = head.next_since;
     displayVehicles();
 }
 
@@ -64,6 +125,8 @@ function displayVehicles() {
              onclick="selectVehicle(${vehicle.id})">
             <h3>${vehicle.name}</h3>
             <p>Default Rate: ₹${vehicle.default_rate.toFixed(2)}/km</p>
+            <p>Trips: ${vehicle.summary.entry_count} | Total: ₹${vehicle.summary.total_amount.toFixed(2)}</p>
+            <p style="font-size: 12px; color: #999;">Last Trip: ${vehicle.summary.last_trip_date ? new Date(vehicle.summary.last_trip_date).toLocaleDateString() : '-'}</p>
             <p style="font-size: 12px; color: #999;">Created: ${new Date(vehicle.created_at).toLocaleDateString()}</p>
         </div>
     `).join('');
@@ -95,7 +158,7 @@ async function handleAddVehicle(e) {
     showMessage(result.message, 'success');
     closeModal('addVehicleModal');
     document.getElementById('addVehicleForm').reset();
-    await loadVehicles();
+    await syncChanges();
 }
 
 function showEditVehicleModal() {
@@ -119,7 +182,7 @@ async function handleEditVehicle(e) {
     const result = await apiCall(`/api/vehicles/${currentVehicleId}`, 'PUT', data);
     showMessage(result.message, 'success');
     closeModal('editVehicleModal');
-    await loadVehicles();
+    await syncChanges();
     await selectVehicle(currentVehicleId);
 }
 
@@ -132,30 +195,107 @@ async function deleteVehicle() {
     
     const result = await apiCall(`/api/vehicles/${currentVehicleId}`, 'DELETE');
     showMessage(result.message, 'success');
+    await syncChanges();
+}
+
+// Route functions
+async function loadRoutes() {
+    routes = await apiCall('/api/routes');
+    renderRouteOptions();
+}
+
+function renderRouteOptions() {
+    document.getElementById('routeOptions').innerHTML = routes.map(route => `
+        <option value="${route.name}">
+    `).join('');
+}
+
+async function refreshRoutesFor(routeName) {
+    if (!routes.some(r => r.name === routeName.trim())) {
+        await loadRoutes();
+    }
+}
+
+function applyRouteDefaults() {
+    const name = document.getElementById('routeName').value.trim();
+    const route = routes.find(r => r.name === name);
+    if (!route) return;
     
-    currentVehicleId = null;
-    document.getElementById('vehicleDetails').classList.add('hidden');
-    await loadVehicles();
+    if (route.default_km !== null) {
+        document.getElementById('kmDriven').value = route.default_km;
+    }
+    if (route.default_rate !== null) {
+        document.getElementById('rate').value = route.default_rate;
+    }
+    calculateAmount();
 }
 
 // Entry functions
 async function loadEntries() {
     if (!currentVehicleId) return;
     
-    entries = await apiCall(`/api/vehicles/${currentVehicleId}/entries`);
+    if (!entryCache[currentVehicleId]) {
+        entryCache[currentVehicleId] = {rows: [], nextCursor: null, complete: false, loading: false};
+        await loadMoreEntries(currentVehicleId);
+    }
+    entries = entryCache[currentVehicleId].rows;
+    document.getElementById('entriesScroll').scrollTop = 0;
     displayEntries();
     displayStats();
 }
 
+async function loadMoreEntries(vehicleId) {
+    const cache = entryCache[vehicleId];
+    if (cache.loading || cache.complete) return;
+    
+    cache.loading = true;
+    try {
+        let url = `/api/vehicles/${vehicleId}/entries?limit=${ENTRY_PAGE_SIZE}`;
+        if (cache.nextCursor) {
+            url += `&cursor=${encodeURIComponent(cache.nextCursor)}`;
+        }
+        const page = await apiCall(url);
+        cache.rows.push(...page.entries);
+        cache.nextCursor = page.next_cursor;
+        cache.complete = !page.next_cursor;
+    } finally {
+        cache.loading = false;
+    }
+}
+
 function displayEntries() {
     const tbody = document.getElementById('entriesBody');
     
-    if (entries.length === 0) {
+    const cache = entryCache[currentVehicleId];
+    
+    if (entries.length === 0 && (!cache || cache.complete)) {
         tbody.innerHTML = '<tr><td colspan="8" class="no-data">No entries yet. Click "Add Entry" to get started.</td></tr>';
         return;
     }
     
-    tbody.innerHTML = entries.map(entry => `
+    // Render only the rows in view; spacer rows keep the scroll height
+    const scroller = document.getElementById('entriesScroll');
+    const first = Math.max(0, Math.floor(scroller.scrollTop / ENTRY_ROW_HEIGHT) - ENTRY_OVERSCAN);
+    const visible = Math.ceil(scroller.clientHeight / ENTRY_ROW_HEIGHT) + 2 * ENTRY_OVERSCAN;
+    const last = Math.min(entries.length, first + visible);
+    
+    tbody.innerHTML = spacerRow(first * ENTRY_ROW_HEIGHT)
+        + entries.slice(first, last).map(entryRow).join('')
+        + spacerRow((entries.length - last) * ENTRY_ROW_HEIGHT);
+    
+    // Fetch the next page before the user reaches the end of what is loaded
+    if (cache && !cache.complete && !cache.loading && last + ENTRY_PAGE_SIZE / 2 >= entries.length) {
+        const vehicleId = currentVehicleId;
+        loadMoreEntries(vehicleId).then(() => {
+            if (currentVehicleId === vehicleId) {
+                displayEntries();
+            }
+        });
+    }
+}
+
+function entryRow(entry) {
+    return `
         <tr>
             <td>${new Date(entry.date).toLocaleDateString()}</td>
             <td>${entry.route_name}</td>
@@ -164,40 +304,45 @@ function displayEntries() {
             <td>₹${entry.amount.toFixed(2)}</td>
             <td>₹${entry.extra.toFixed(2)}</td>
             <td><strong>₹${entry.total_amount.toFixed(2)}</strong></td>
-            <td class="actions">
-                <button class="btn btn-small btn-secondary" onclick="showEditEntryModal(${entry.id})">Edit</button>
-                <button class="btn btn-small btn-danger" onclick="deleteEntry(${entry.id})">Delete</button>
+            <td>
+                <div class="actions">
+                    <button class="btn btn-small btn-secondary" onclick="showEditEntryModal(${entry.id})">Edit</button>
+                    <button class="btn btn-small btn-danger" onclick="deleteEntry(${entry.id})">Delete</button>
+                </div>
             </td>
         </tr>
-    `).join('');
+    `;
+}
+
+function spacerRow(height) {
+    return height > 0 ? `<tr class="spacer" style="height: ${height}px"><td colspan="8"></td></tr>` : '';
 }
 
 function displayStats() {
-    if (entries.length === 0) {
+    // Totals come from the server summary since only some entries are loaded
+    const vehicle = vehicles.find(v => v.id === currentVehicleId);
+    if (!vehicle || vehicle.summary.entry_count === 0) {
         document.getElementById('statsSection').innerHTML = '';
         return;
     }
     
-    const totalKm = entries.reduce((sum, e) => sum + e.km_driven, 0);
-    const totalAmount = entries.reduce((sum, e) => sum + e.total_amount, 0);
-    const totalExtra = entries.reduce((sum, e) => sum + e.extra, 0);
-    
+    const summary = vehicle.summary;
     document.getElementById('statsSection').innerHTML = `
         <div class="stat-card">
             <h4>Total Entries</h4>
-            <p>${entries.length}</p>
+            <p>${summary.entry_count}</p>
         </div>
         <div class="stat-card">
             <h4>Total Kilometers</h4>
-            <p>${totalKm.toFixed(2)}</p>
+            <p>${summary.total_km.toFixed(2)}</p>
         </div>
         <div class="stat-card">
             <h4>Total Extra Charges</h4>
-            <p>₹${totalExtra.toFixed(2)}</p>
+            <p>₹${summary.total_extra.toFixed(2)}</p>
         </div>
         <div class="stat-card">
             <h4>Grand Total</h4>
-            <p>₹${totalAmount.toFixed(2)}</p>
+            <p>₹${summary.total_amount.toFixed(2)}</p>
         </div>
     `;
 }
@@ -237,7 +382,8 @@ async function handleAddEntry(e) {
         extra: document.getElementById('extra').value
     };
     
-    const result = await apiCall(`/api/vehicles/${currentVehicleId}/entries`, 'POST', data);
+    const result = await apiCall(`/api/vehicles/${currentVehicleId}/entries`, 'POST', data,
+                                 {'Idempotency-Key': newIdempotencyKey()});
     showMessage(result.message, 'success');
     closeModal('addEntryModal');
     document.getElementById('addEntryForm').reset();
@@ -248,7 +394,8 @@ async function handleAddEntry(e) {
     document.getElementById('extra').value = 0;
     document.getElementById('entryDate').value = new Date().toISOString().split('T')[0];
     
-    await loadEntries();
+    await syncChanges();
+    await refreshRoutesFor(data.route_name);
 }
 
 function showEditEntryModal(entryId) {
@@ -269,19 +416,48 @@ function showEditEntryModal(entryId) {
 async function handleEditEntry(e) {
     e.preventDefault();
     
-    const entryId = document.getElementById('editEntryId').value;
-    const data = {
+    const entryId = parseInt(document.getElementById('editEntryId').value);
+    const entry = entries.find(e => e.id === entryId);
+    const form = {
         date: document.getElementById('editEntryDate').value,
         route_name: document.getElementById('editRouteName').value,
-        km_driven: document.getElementById('editKmDriven').value,
-        rate: document.getElementById('editRate').value,
-        extra: document.getElementById('editExtra').value
+        km_driven: parseFloat(document.getElementById('editKmDriven').value),
+        rate: parseFloat(document.getElementById('editRate').value),
+        extra: parseFloat(document.getElementById('editExtra').value) || 0
     };
     
-    const result = await apiCall(`/api/vehicles/${currentVehicleId}/entries/${entryId}`, 'PUT', data);
-    showMessage(result.message, 'success');
-    closeModal('editEntryModal');
-    await loadEntries();
+    // Send only the changed fields, along with the version that was edited
+    const data = {version: entry.version};
+    for (const field in form) {
+        if (form[field] !== entry[field]) {
+            data[field] = form[field];
+        }
+    }
+    if (Object.keys(data).length === 1) {
+        closeModal('editEntryModal');
+        return;
+    }
+    
+    try {
+        const result = await apiCall(`/api/vehicles/${currentVehicleId}/entries/${entryId}`, 'PATCH', data);
+        showMessage(result.message, 'success');
+        closeModal('editEntryModal');
+    } catch (error) {
+        if (error.status !== 409) throw error;
+        // Someone else saved first: show their version so the edit can be redone
+        await syncChanges();
+        showMessage('This entry was changed by someone else. Review the latest values and save again.', 'error');
+        if (entries.some(e => e.id === entryId)) {
+            showEditEntryModal(entryId);
+        } else {
+            closeModal('editEntryModal');
+        }
+        return;
+    }
+    await syncChanges();
+    if (data.route_name) {
+        await refreshRoutesFor(data.route_name);
+    }
 }
 
 async function deleteEntry(entryId) {
@@ -291,7 +467,114 @@ async function deleteEntry(entryId) {
     
     const result = await apiCall(`/api/vehicles/${currentVehicleId}/entries/${entryId}`, 'DELETE');
     showMessage(result.message, 'success');
-    await loadEntries();
+    await syncChanges();
+}
+
+// Change feed sync
+async function syncChanges() {
+    let page;
+    do {
+        const response = await fetch(`/api/changes?since=${lastChangeSeq}`);
+        if (response.status === 410) {
+            // The server pruned changes we have not seen; start over
+            await reloadAll();
+            return;
+        }
+        if (!response.ok) {
+            showMessage('An error occurred. Please try again.', 'error');
+            return;
+        }
+        page = await response.json();
+        page.changes.forEach(applyChange);
+        lastChangeSeq = page.next_since;
+    } while (page.has_more);
+    
+    displayVehicles();
+    if (currentVehicleId) {
+        entries = entryCache[currentVehicleId] ? entryCache[currentVehicleId].rows : [];
+        displayEntries();
+        displayStats();
+    }
+}
+
+async function reloadAll() {
+    entryCache = {};
+    await loadVehicles();
+    if (currentVehicleId && vehicles.some(v => v.id === currentVehicleId)) {
+        await loadEntries();
+    } else {
+        closeVehicleDetails();
+    }
+}
+
+function applyChange(change) {
+    if (change.entity === 'route') {
+        // A rename shows up in every cached entry on the route
+        const index = routes.findIndex(r => r.id === change.id);
+        if (index !== -1) {
+            routes[index] = change.data;
+            renderRouteOptions();
+        }
+        Object.values(entryCache).forEach(cache => cache.rows.forEach(e => {
+            if (e.route_id === change.id) {
+                e.route_name = change.data.name;
+            }
+        }));
+        return;
+    }
+    
+    if (change.entity === 'vehicle') {
+        const index = vehicles.findIndex(v => v.id === change.id);
+        if (index !== -1) {
+            vehicles.splice(index, 1);
+        }
+        if (change.op === 'upsert' && !change.data.archived) {
+            vehicles.splice(index === -1 ? vehicles.length : index, 0, change.data);
+        } else {
+            delete entryCache[change.id];
+            if (currentVehicleId === change.id) {
+                closeVehicleDetails();
+            }
+        }
+        return;
+    }
+    
+    // Entries are only tracked for vehicles that have been opened
+    const cache = entryCache[change.vehicle_id];
+    if (!cache) return;
+    
+    const rows = cache.rows;
+    const index = rows.findIndex(e => e.id === change.id);
+    if (index !== -1) {
+        rows.splice(index, 1);
+    }
+    if (change.op === 'upsert' && !isBeyondLoadedPages(cache, change.data)) {
+        // Keep the newest-first (date, id) order of the entries listing
+        const position = rows.findIndex(e => compareEntries(e, change.data) > 0);
+        rows.splice(position === -1 ? rows.length : position, 0, change.data);
+    }
+}
+
+// Positive when a comes after b in the newest-first listing order
+function compareEntries(a, b) {
+    if (a.date !== b.date) {
+        return a.date < b.date ? 1 : -1;
+    }
+    return b.id - a.id;
+}
+
+// Rows past the page cursor arrive with a later page instead
+function isBeyondLoadedPages(cache, entry) {
+    if (cache.complete) return false;
+    if (!cache.nextCursor) return true;
+    const [date, id] = cache.nextCursor.split(':');
+    return compareEntries(entry, {date: date, id: parseInt(id)}) > 0;
+}
+
+function closeVehicleDetails() {
+    currentVehicleId = null;
+    entries = [];
+    document.getElementById('vehicleDetails').classList.add('hidden');
 }
 
 // PDF Generation
@@ -305,8 +588,43 @@ async function handleGeneratePdf(e) {
         to_address: document.getElementById('toAddress').value
     };
     
+    const downloaded = await downloadPdf(`/api/vehicles/${currentVehicleId}/generate-pdf`, data,
+                                         `transport_report_${data.start_date}_to_${data.end_date}.pdf`);
+    if (downloaded) {
+        closeModal('generatePdfModal');
+        document.getElementById('generatePdfForm').reset();
+    }
+}
+
+async function handleConsolidatedPdf(e) {
+    e.preventDefault();
+    
+    const vehicleIds = Array.from(document.querySelectorAll('#consolidatedVehicleList input:checked'))
+        .map(input => parseInt(input.value));
+    if (vehicleIds.length === 0) {
+        showMessage('Please select at least one vehicle', 'error');
+        return;
+    }
+    
+    const data = {
+        vehicle_ids: vehicleIds,
+        start_date: document.getElementById('consolidatedStartDate').value,
+        end_date: document.getElementById('consolidatedEndDate').value,
+        from_address: document.getElementById('consolidatedFromAddress').value,
+        to_address: document.getElementById('consolidatedToAddress').value
+    };
+    
+    const downloaded = await downloadPdf('/api/reports/consolidated', data,
+                                         `consolidated_report_${data.start_date}_to_${data.end_date}.pdf`);
+    if (downloaded) {
+        closeModal('consolidatedPdfModal');
+        document.getElementById('consolidatedPdfForm').reset();
+    }
+}
+
+async function downloadPdf(url, data, filename) {
     try {
-        const response = await fetch(`/api/vehicles/${currentVehicleId}/generate-pdf`, {
+        const response = await fetch(url, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -317,26 +635,26 @@ async function handleGeneratePdf(e) {
         if (!response.ok) {
             const error = await response.json();
             showMessage(error.error || 'Failed to generate PDF', 'error');
-            return;
+            return false;
         }
         
         // Download the PDF
         const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
+        const blobUrl = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
-        a.href = url;
-        a.download = `transport_report_${data.start_date}_to_${data.end_date}.pdf`;
+        a.href = blobUrl;
+        a.download = filename;
         document.body.appendChild(a);
         a.click();
-        window.URL.revokeObjectURL(url);
+        window.URL.revokeObjectURL(blobUrl);
         document.body.removeChild(a);
         
         showMessage('PDF generated successfully!', 'success');
-        closeModal('generatePdfModal');
-        document.getElementById('generatePdfForm').reset();
+        return true;
     } catch (error) {
         console.error('PDF generation error:', error);
         showMessage('Failed to generate PDF. Please try again.', 'error');
+        return false;
     }
 }
 
@@ -370,6 +688,29 @@ function showGeneratePdfModal() {
     document.getElementById('generatePdfModal').style.display = 'block';
 }
 
+function showConsolidatedPdfModal() {
+    if (vehicles.length === 0) {
+        showMessage('Please add a vehicle first', 'error');
+        return;
+    }
+    
+    document.getElementById('consolidatedVehicleList').innerHTML = vehicles.map(vehicle => `
+        <label>
+            <input type="checkbox" value="${vehicle.id}" checked>${vehicle.name}
+        </label>
+    `).join('');
+    
+    // Set default date range (current month)
+    const now = new Date();
+    const firstDay = new Date(now.getFullYear(), now.getMonth(), 1);
+    const lastDay = new Date(now.getFullYear(), now.getMonth() + 1, 0);
+    
+    document.getElementById('consolidatedStartDate').value = firstDay.toISOString().split('T')[0];
+    document.getElementById('consolidatedEndDate').value = lastDay.toISOString().split('T')[0];
+    
+    document.getElementById('consolidatedPdfModal').style.display = 'block';
+}
+
 function closeModal(modalId) {
     document.getElementById(modalId).style.display = 'none';
 }
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    # Load a copy of app.py so its databases live in tmp_path/instance
+    shutil.copy(os.path.join(REPO, 'app.py'), tmp_path / 'app.py')
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location('app_under_test', tmp_path / 'app.py')
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, 'app_under_test', module)
+    spec.loader.exec_module(module)
+    module.limiter.limits = {}
+    with module.app.app_context():
+        yield module
+        module.db.session.remove()
+        for engine in module.db.engines.values():
+            engine.dispose()
+
+def add_entry(client, vehicle_id, date):
+    response = client.post(f'/api/vehicles/{vehicle_id}/entries', json={
+        'date': date, 'route_name': 'Depot', 'km_driven': 10, 'rate': 5
+    })
+    assert response.status_code == 201
+    return response.json['id']
+
+def test_archived_ids_are_not_reused(app_module):
+    from datetime import date
+    client = app_module.app.test_client()
+    vehicle_id = client.post('/api/vehicles', json={'name': 'T1', 'default_rate': 5}).json['id']
+    
+    first_id = add_entry(client, vehicle_id, '2026-09-01')
+    assert app_module.archive_entries(date(2026, 10, 1)) == 1
+    second_id = add_entry(client, vehicle_id, '2026-09-02')
+    assert second_id != first_id
+    assert app_module.archive_entries(date(2026, 10, 1)) == 1
+    
+    assert app_module.ArchivedEntry.query.count() == 2
+    summary = client.get('/api/vehicles?summary=1').json[0]['summary']
+    assert summary['entry_count'] == 2
+
+def test_archive_conflict_keeps_live_entry(app_module):
+    from datetime import date, datetime
+    client = app_module.app.test_client()
+    vehicle_id = client.post('/api/vehicles', json={'name': 'T1', 'default_rate': 5}).json['id']
+    entry_id = add_entry(client, vehicle_id, '2026-09-01')
+    app_module.db.session.add(app_module.ArchivedEntry(
+        id=entry_id, vehicle_id=vehicle_id, date=date(2026, 8, 1), route_name='Other',
+        km_driven=1, rate=1, amount=1, extra=0, total_amount=1, created_at=datetime(2020, 1, 1)
+    ))
+    app_module.db.session.commit()
+    
+    with pytest.raises(RuntimeError):
+        app_module.archive_entries(date(2026, 10, 1))
+    assert app_module.TransportEntry.query.count() == 1
+
+def test_entry_edited_during_archiving_stays_live(app_module):
+    from datetime import date
+    client = app_module.app.test_client()
+    vehicle_id = client.post('/api/vehicles', json={'name': 'T1', 'default_rate': 5}).json['id']
+    entry_id = add_entry(client, vehicle_id, '2026-09-01')
+    
+    # Commit an edit right after the batch is copied, before it is deleted
+    session = app_module.db.session
+    commit = session.commit
+    def commit_then_edit():
+        commit()
+        session.commit = commit
+        with app_module.db.engine.begin() as conn:
+            conn.execute(app_module.text(
+                'UPDATE transport_entry SET km_driven = 20, version = version + 1 WHERE id = :id'
+            ), {'id': entry_id})
+    session.commit = commit_then_edit
+    
+    assert app_module.archive_entries(date(2026, 10, 1), batch_size=1) == 1
+    assert app_module.ArchivedEntry.query.get(entry_id).km_driven == 20
+    assert app_module.TransportEntry.query.count() == 0